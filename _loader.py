@@ -0,0 +1,147 @@
+"""
+Chargement partagé du modèle ONNX et du tokenizer, et utilitaires communs aux scripts de test
+Chaque fichier n'est chargé qu'une fois par processus (ex: pytest lançant les deux scripts)
+"""
+
+import os
+from functools import lru_cache
+
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer
+
+# Longueur maximale d'une paire tokenisée
+MAX_LENGTH = 128
+
+# Barres de progression pré-calculées (0 à 40 caractères remplis)
+_BARS = ["█" * i + "░" * (40 - i) for i in range(41)]
+
+# Types numpy des inputs entiers du modèle (input_ids, attention_mask)
+_ORT_INPUT_DTYPES = {
+    'tensor(int64)': np.int64,
+    'tensor(int32)': np.int32,
+}
+
+
+def _build_session_options():
+    """Options de session: exécution séquentielle, toutes les optimisations
+    de graphe et dénormaux forcés à zéro
+
+    intra_op_num_threads est laissé au défaut d'ONNX Runtime, qui utilise déjà
+    le nombre de cœurs physiques.
+    """
+    session_options = ort.SessionOptions()
+    session_options.inter_op_num_threads = 1
+    session_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session_options.add_session_config_entry('session.set_denormal_as_zero', '1')
+    return session_options
+
+
+@lru_cache(maxsize=1)
+def get_session_options():
+    """Retourne les options de session partagées (sans sérialisation du graphe)"""
+    return _build_session_options()
+
+
+def get_providers():
+    """Execution providers par ordre de préférence
+
+    CPU MLAS par défaut. OpenVINO (noyaux Intel) sur demande avec USE_OPENVINO=1,
+    s'il est installé via onnxruntime-openvino: il doit alors recevoir le modèle
+    non fusionné (model.onnx), les opérateurs com.microsoft de model.opt.onnx
+    n'étant pas pris en charge par OpenVINO.
+    """
+    if os.environ.get('USE_OPENVINO') == '1' and 'OpenVINOExecutionProvider' in ort.get_available_providers():
+        return [('OpenVINOExecutionProvider', {'device_type': 'CPU'}), 'CPUExecutionProvider']
+    return ['CPUExecutionProvider']
+
+
+def ort_optimized_model_path(model_path):
+    """Chemin du graphe optimisé sérialisé par ONNX Runtime pour model_path
+
+    La version d'ONNX Runtime fait partie du nom: un graphe écrit par une autre
+    version n'est jamais rechargé.
+    """
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.ort_opt-{ort.__version__}{ext}"
+
+
+@lru_cache(maxsize=None)
+def get_session(model_path):
+    """Retourne la session ONNX Runtime du modèle, créée au premier appel
+
+    Le premier chargement sérialise le graphe optimisé par ONNX Runtime;
+    les suivants rechargent ce fichier sans refaire les optimisations.
+    Un fichier illisible (ex: run interrompu) est supprimé puis régénéré.
+    Avec OpenVINO, le graphe est compilé par l'EP: les optimisations d'ONNX Runtime,
+    prévues pour le CPU par défaut, sont désactivées et rien n'est sérialisé.
+    """
+    providers = get_providers()
+    if providers != ['CPUExecutionProvider']:
+        session_options = _build_session_options()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        return ort.InferenceSession(model_path, sess_options=session_options, providers=providers)
+
+    cached_model_path = ort_optimized_model_path(model_path)
+    if os.path.exists(cached_model_path) and os.path.getmtime(cached_model_path) >= os.path.getmtime(model_path):
+        session_options = _build_session_options()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        try:
+            return ort.InferenceSession(cached_model_path, sess_options=session_options, providers=providers)
+        except Exception as e:
+            print(f"⚠️  Graphe optimisé illisible ({e}), régénération depuis {model_path}")
+            os.remove(cached_model_path)
+
+    session_options = _build_session_options()
+    session_options.optimized_model_filepath = cached_model_path
+    return ort.InferenceSession(model_path, sess_options=session_options, providers=providers)
+
+
+def get_input_dtype(session, name='input_ids'):
+    """Retourne le type numpy attendu par le modèle pour un input entier"""
+    for input_meta in session.get_inputs():
+        if input_meta.name == name:
+            return _ORT_INPUT_DTYPES[input_meta.type]
+    raise KeyError(f"Input {name} absent du modèle")
+
+
+def run_bound(session, input_ids, attention_mask):
+    """Exécute le modèle via IOBinding et retourne les logits (N, nombre de labels)
+
+    ONNX Runtime lit directement la mémoire des tableaux numpy: aucune copie
+    d'entrée quand ils ont déjà le type attendu par le modèle (int32 ou int64).
+    """
+    io_binding = session.io_binding()
+    for name, array in (('input_ids', input_ids), ('attention_mask', attention_mask)):
+        array = np.ascontiguousarray(array, dtype=get_input_dtype(session, name))
+        io_binding.bind_cpu_input(name, array)
+    io_binding.bind_output(session.get_outputs()[0].name, 'cpu')
+
+    session.run_with_iobinding(io_binding)
+    return io_binding.copy_outputs_to_cpu()[0]
+
+
+def softmax(x, axis=-1, out=None):
+    """Softmax numériquement stable, calculée en place dans out (alloué si absent)"""
+    if out is None:
+        out = np.empty_like(x)
+    np.subtract(x, x.max(axis=axis, keepdims=True), out=out)
+    np.exp(out, out=out)
+    out /= out.sum(axis=axis, keepdims=True)
+    return out
+
+
+def bar(length):
+    """Retourne la barre de progression de length caractères remplis (bornée à 0..40)"""
+    return _BARS[min(40, max(0, length))]
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(tokenizer_path):
+    """Retourne le tokenizer rapide (Rust), chargé au premier appel"""
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_path, use_fast=True)
+    # Sans tokenizer.json, transformers retombe silencieusement sur le tokenizer Python (lent)
+    if not tokenizer.is_fast:
+        raise RuntimeError(f"Tokenizer rapide indisponible: tokenizer.json manquant dans {tokenizer_path}")
+    return tokenizer
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Script de préparation du modèle ONNX mDeBERTa pour l'inférence CPU
+Fusionne les opérateurs du graphe exporté (le détail est affiché à l'exécution),
+passe les inputs en int32, puis quantifie les poids en INT8 et exporte une variante FP16
+À lancer une seule fois avant test_model.py et test_nli.py
+"""
+
+import json
+
+import onnx
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from onnxruntime.transformers.float16 import convert_float_to_float16
+from onnxruntime.transformers.optimizer import optimize_model
+
+# Chemins des fichiers
+source_model_path = "./model.onnx"
+optimized_model_path = "./model.opt.onnx"
+quantized_model_path = "./model.int8.onnx"
+fp16_model_path = "./model.fp16.onnx"
+
+config_path = "./config.json"
+
+
+def fuse_graph():
+    """Fusionne les opérateurs Transformer du modèle exporté
+
+    Le profil 'bert' ne reconnaît pas l'attention désentrelacée de DeBERTa:
+    seules les fusions listées par get_fused_operator_statistics() sont appliquées.
+    Les optimisations d'ONNX Runtime sont limitées au niveau de base (opt_level=1):
+    ce modèle sert d'entrée à la quantification et à la conversion FP16, qui
+    doivent partir d'un graphe prétraité et non d'un graphe propre au matériel.
+    """
+
+    print(f"\n1. Fusion du graphe: {source_model_path} → {optimized_model_path}")
+    # Dimensions du modèle lues dans sa configuration
+    with open(config_path) as f:
+        config = json.load(f)
+
+    model = optimize_model(
+        source_model_path,
+        model_type='bert',
+        num_heads=config['num_attention_heads'],
+        hidden_size=config['hidden_size'],
+        opt_level=1
+    )
+    print(f"   Opérateurs fusionnés: {model.get_fused_operator_statistics()}")
+
+    model.save_model_to_file(optimized_model_path)
+    print(f"✓ Modèle optimisé sauvegardé")
+
+
+def cast_inputs_to_int32():
+    """Passe les inputs int64 du modèle optimisé (input_ids, attention_mask) en int32
+
+    Un Cast vers int64 est inséré en tête du graphe: les scripts fournissent
+    directement des tenseurs int32 (le vocabulaire de 250k tokens tient en int32).
+    """
+
+    print(f"\n2. Inputs int32: {optimized_model_path}")
+    model = onnx.load(optimized_model_path)
+    graph = model.graph
+
+    # Les anciens exports listent aussi les initializers parmi les inputs: leurs
+    # données restent en int64 et ne doivent pas être retypées
+    initializer_names = {initializer.name for initializer in graph.initializer}
+
+    cast_nodes = []
+    for graph_input in graph.input:
+        tensor_type = graph_input.type.tensor_type
+        if tensor_type.elem_type != onnx.TensorProto.INT64 or graph_input.name in initializer_names:
+            continue
+
+        # Rebrancher les consommateurs de l'input sur la sortie du Cast
+        int64_name = f"{graph_input.name}_int64"
+        for node in graph.node:
+            for i, name in enumerate(node.input):
+                if name == graph_input.name:
+                    node.input[i] = int64_name
+
+        cast_nodes.append(onnx.helper.make_node(
+            'Cast',
+            [graph_input.name],
+            [int64_name],
+            name=f"Cast_{graph_input.name}_int64",
+            to=onnx.TensorProto.INT64
+        ))
+        tensor_type.elem_type = onnx.TensorProto.INT32
+        print(f"   - {graph_input.name}: int64 → int32")
+
+    for node in reversed(cast_nodes):
+        graph.node.insert(0, node)
+
+    onnx.save(model, optimized_model_path)
+    print(f"✓ Modèle optimisé mis à jour")
+
+
+def quantize_int8():
+    """Quantifie dynamiquement les poids du modèle optimisé en INT8"""
+
+    print(f"\n3. Quantification INT8: {optimized_model_path} → {quantized_model_path}")
+    # per_channel limite la perte de précision par rapport à la quantification par tenseur
+    quantize_dynamic(
+        optimized_model_path,
+        quantized_model_path,
+        weight_type=QuantType.QInt8,
+        per_channel=True
+    )
+    print(f"✓ Modèle quantifié sauvegardé")
+
+
+def convert_fp16():
+    """Convertit les poids du modèle optimisé en FP16
+
+    Le CPU Execution Provider n'a pas de noyaux FP16 pour la plupart des opérateurs
+    (dont MatMul) sur x86: ONNX Runtime y réinsère des Cast vers FP32. Le gain de
+    vitesse dépend donc de l'execution provider; seule la taille des poids est divisée par 2.
+    """
+
+    print(f"\n4. Conversion FP16: {optimized_model_path} → {fp16_model_path}")
+    model = onnx.load(optimized_model_path)
+    # keep_io_types: les logits restent en FP32 (les inputs entiers ne sont pas concernés)
+    onnx.save(convert_float_to_float16(model, keep_io_types=True), fp16_model_path)
+    print(f"✓ Modèle FP16 sauvegardé")
+
+
+def optimize():
+    """Prépare les modèles optimisés utilisés par les scripts de test"""
+
+    print("=" * 60)
+    print("Optimisation du modèle ONNX mDeBERTa")
+    print("=" * 60)
+
+    fuse_graph()
+    cast_inputs_to_int32()
+    quantize_int8()
+    convert_fp16()
+
+    print("\n" + "=" * 60)
+    print("✓ Optimisation terminée avec succès!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    try:
+        optimize()
+    except Exception as e:
+        print(f"\n❌ Erreur lors de l'optimisation: {e}")
+        import traceback
+        traceback.print_exc()
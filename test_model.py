@@ -4,9 +4,60 @@ Script de test pour le modèle ONNX mDeBERTa
 Permet de valider que le modèle fonctionne avant l'intégration iOS
 """
 
-import onnxruntime as ort
+import os
+import sys
+from functools import lru_cache
+
 import numpy as np
-from transformers import AutoTokenizer
+
+from _loader import (
+    MAX_LENGTH, bar, get_providers, get_session, get_session_options, get_tokenizer,
+    run_bound, softmax
+)
+
+# Écart absolu toléré entre le calcul manuel et le pipeline optimum
+MAX_PIPELINE_GAP = 0.01
+
+@lru_cache(maxsize=None)
+def encode_hypothesis(tokenizer, label):
+    """Retourne les token IDs (sans tokens spéciaux) de l'hypothèse NLI d'un label
+
+    Mis en cache par (tokenizer, label): le cache garde une référence au tokenizer,
+    dont l'identité ne peut donc pas être réutilisée par un autre objet.
+    """
+    # Le template par défaut du pipeline zero-shot est "This example is {}."
+    hypothesis = f"This example is {label}."
+    return tokenizer(hypothesis, add_special_tokens=False)['input_ids']
+
+
+def encode_pairs(tokenizer, text, candidate_labels, max_length=MAX_LENGTH):
+    """Construit le batch [CLS] texte [SEP] hypothèse [SEP] pour chaque label
+
+    Le texte est tokenisé une seule fois et les hypothèses sont mises en cache,
+    puis les séquences sont paddées à la plus longue du batch.
+    """
+    text_ids = tokenizer(text, add_special_tokens=False)['input_ids']
+    num_special_tokens = tokenizer.num_special_tokens_to_add(pair=True)
+
+    sequences = []
+    for label in candidate_labels:
+        # Tronquer l'hypothèse puis le texte pour respecter max_length
+        hypothesis_ids = encode_hypothesis(tokenizer, label)[:max_length - num_special_tokens]
+        text_budget = max_length - num_special_tokens - len(hypothesis_ids)
+        sequences.append(tokenizer.build_inputs_with_special_tokens(text_ids[:max(0, text_budget)], hypothesis_ids))
+
+    seq_len = max(len(ids) for ids in sequences)
+    input_ids = np.stack([
+        np.pad(ids, (0, seq_len - len(ids)), constant_values=tokenizer.pad_token_id)
+        for ids in sequences
+    ])
+    attention_mask = np.stack([
+        np.pad(np.ones(len(ids), dtype=np.int64), (0, seq_len - len(ids)))
+        for ids in sequences
+    ])
+
+    return input_ids, attention_mask
+
 
 def test_onnx_model():
     """Teste le modèle ONNX avec ONNX Runtime"""
@@ -17,20 +68,18 @@ def test_onnx_model():
 
     # Chemins des fichiers
     # Utiliser le modèle COMPLET (non-quantifié) pour de meilleurs résultats
-    model_path = "./model.onnx"
-    # model_path = "mDeBERTa-v3-base-xnli-multilingual-nli-2mil7/onnx/model_quantized.onnx"  # Version quantifiée (moins précise)
+    model_path = "./model.opt.onnx"  # Généré par optimize_model.py
+    # model_path = "./model.int8.onnx"  # Version INT8 (précision non vérifiée, voir SOLUTION_FINALE.md)
+    # model_path = "./model.fp16.onnx"  # Version FP16 (poids 2× plus légers, vitesse selon l'execution provider)
     tokenizer_path = "./"
 
     print("\n1. Chargement du tokenizer...")
-    tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+    tokenizer = get_tokenizer(tokenizer_path)
     print(f"✓ Tokenizer chargé: {tokenizer.__class__.__name__}")
     print(f"  Vocabulaire: {tokenizer.vocab_size} tokens")
 
     print("\n2. Chargement du modèle ONNX...")
-    session = ort.InferenceSession(
-        model_path,
-        providers=['CPUExecutionProvider']
-    )
+    session = get_session(model_path)
     print(f"✓ Modèle ONNX chargé")
 
     # Afficher les inputs/outputs
@@ -52,78 +101,86 @@ def test_onnx_model():
     print(f"\n   Texte: \"{text}\"")
     print(f"   Labels candidats: {candidate_labels}")
 
-    results = []
+    # Tokeniser toutes les paires (texte, hypothèse) en un seul batch
+    input_ids, attention_mask = encode_pairs(tokenizer, text, candidate_labels)
 
-    for label in candidate_labels:
-        # Créer l'hypothèse au format NLI
-        # Le template par défaut du pipeline zero-shot est "This example is {}."
-        hypothesis = f"This example is {label}."
-
-        # Tokeniser
-        inputs = tokenizer(
-            text,
-            hypothesis,
-            truncation=True,
-            max_length=128,
-            padding='max_length',
-            return_tensors='np'
-        )
-
-        # Préparer les inputs pour ONNX Runtime
-        ort_inputs = {
-            'input_ids': inputs['input_ids'].astype(np.int64),
-            'attention_mask': inputs['attention_mask'].astype(np.int64)
-        }
-
-        # Inférence
-        outputs = session.run(None, ort_inputs)
-        logits = outputs[0][0]
-
-        # Extraire le logit d'entailment (on appliquera softmax plus tard sur tous les labels)
-        # Pour CE modèle spécifique: [entailment, neutral, contradiction] (voir config.json)
-        entailment_logit = logits[0]  # Index 0 = entailment pour ce modèle
-
-        # Calculer aussi les probabilités pour affichage
-        exp_logits = np.exp(logits - np.max(logits))
-        probs = exp_logits / exp_logits.sum()
+    # Inférence: une seule passe pour tous les labels, logits de forme (N, 3)
+    logits = run_bound(session, input_ids, attention_mask)
+    softmax_buffer = np.empty_like(logits)
 
-        results.append({
-            'label': label,
-            'entailment_logit': entailment_logit,  # <- Important pour le softmax final
-            'logits': logits,
-            'probs': probs
-        })
+    # Extraire les logits d'entailment (on appliquera softmax plus tard sur tous les labels)
+    # Pour CE modèle spécifique: [entailment, neutral, contradiction] (voir config.json)
+    entailment_logits = logits[:, 0]  # Index 0 = entailment pour ce modèle
 
     # Appliquer softmax sur les LOGITS d'entailment (comme le pipeline avec multi_label=False)
     # C'est ce que fait le pipeline zero-shot classification par défaut
-    entailment_logits = np.array([r['entailment_logit'] for r in results])
-
     # Softmax sur les logits: exp(logit) / sum(exp(logits))
-    exp_logits = np.exp(entailment_logits - entailment_logits.max())  # Soustraire max pour stabilité numérique
-    normalized_scores = exp_logits / exp_logits.sum()
-
-    # Mettre à jour les scores
-    for i, result in enumerate(results):
-        result['normalized_score'] = normalized_scores[i]
+    normalized_scores = softmax(entailment_logits)
 
     # Trier par score normalisé décroissant
-    results.sort(key=lambda x: x['normalized_score'], reverse=True)
+    order = np.argsort(-normalized_scores, kind='stable')
+    results = [
+        {
+            'label': candidate_labels[i],
+            'logits': logits[i],
+            'normalized_score': normalized_scores[i]
+        }
+        for i in order
+    ]
 
     print("\n5. Résultats de classification (scores normalisés):")
     print("   " + "-" * 50)
     for i, result in enumerate(results, 1):
         bar_length = int(result['normalized_score'] * 40)
-        bar = "█" * bar_length + "░" * (40 - bar_length)
-        print(f"   {i}. {result['label']:15} {result['normalized_score']:.2%}  {bar}")
+        print(f"   {i}. {result['label']:15} {result['normalized_score']:.2%}  {bar(bar_length)}")
+
+    # Probabilités NLI par label, uniquement pour l'affichage: softmax sur chaque ligne (N, 3)
+    per_label_probs = softmax(logits, out=softmax_buffer)
 
     print("\n6. Détails des probabilités NLI:")
     print("   " + "-" * 50)
-    for result in results:
+    for i, result in zip(order, results):
+        result['probs'] = per_label_probs[i]
         print(f"\n   {result['label']}:")
         print(f"     Entailment:    {result['probs'][0]:.4f}  <- utilisé pour le score")
         print(f"     Neutral:       {result['probs'][1]:.4f}")
         print(f"     Contradiction: {result['probs'][2]:.4f}")
 
+    # Le calcul manuel ci-dessus reproduit celui de TextClassifier.swift;
+    # le pipeline optimum sert de référence pour vérifier les scores.
+    # Optionnel (charge une seconde session du modèle): CHECK_PIPELINE=1
+    if os.environ.get('CHECK_PIPELINE') == '1':
+        print("\n7. Comparaison avec le pipeline zero-shot (optimum)...")
+        try:
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+            from transformers import pipeline
+        except ImportError:
+            raise RuntimeError("CHECK_PIPELINE=1 nécessite optimum (pip install optimum[onnxruntime])")
+
+        # Même execution provider que la session principale (OpenVINO ou CPU)
+        provider = get_providers()[0]
+        provider, provider_options = provider if isinstance(provider, tuple) else (provider, None)
+
+        ort_model = ORTModelForSequenceClassification.from_pretrained(
+            tokenizer_path,
+            file_name=os.path.basename(model_path),
+            provider=provider,
+            provider_options=provider_options,
+            session_options=get_session_options()
+        )
+        classifier = pipeline('zero-shot-classification', model=ort_model, tokenizer=tokenizer)
+        reference = classifier(text, candidate_labels, multi_label=False)
+
+        reference_scores = dict(zip(reference['labels'], reference['scores']))
+        for result in results:
+            print(f"   {result['label']:15} {reference_scores[result['label']]:.2%}")
+        max_gap = max(abs(reference_scores[r['label']] - r['normalized_score']) for r in results)
+        print(f"   Écart maximal avec le calcul manuel: {max_gap:.4%}")
+        if max_gap > MAX_PIPELINE_GAP:
+            raise RuntimeError(
+                f"Scores incohérents avec le pipeline optimum: écart {max_gap:.2%} > {MAX_PIPELINE_GAP:.2%}"
+            )
+
     print("\n" + "=" * 60)
     print("✓ Test terminé avec succès!")
     print("=" * 60)
@@ -138,3 +195,4 @@ if __name__ == "__main__":
         print(f"\n❌ Erreur lors du test: {e}")
         import traceback
         traceback.print_exc()
+        sys.exit(1)
@@ -4,9 +4,8 @@ Script de test pour le NLI (Natural Language Inference)
 Teste directement les capacités d'inférence du modèle mDeBERTa avec ONNX Runtime
 """
 
-import onnxruntime as ort
-import numpy as np
-from transformers import AutoTokenizer
+from _loader import MAX_LENGTH, bar, get_session, get_tokenizer, run_bound, softmax
+
 
 def test_nli():
     """Teste le modèle NLI avec des paires premise-hypothesis"""
@@ -16,128 +15,81 @@ def test_nli():
     print("=" * 60)
 
     # Chemins des fichiers locaux
-    model_path = "./model.onnx"
+    model_path = "./model.opt.onnx"  # Généré par optimize_model.py
+    # model_path = "./model.int8.onnx"  # Version INT8 (précision non vérifiée, voir SOLUTION_FINALE.md)
+    # model_path = "./model.fp16.onnx"  # Version FP16 (poids 2× plus légers, vitesse selon l'execution provider)
     tokenizer_path = "./"
 
     print(f"\n1. Chargement du tokenizer depuis {tokenizer_path}")
-    tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+    tokenizer = get_tokenizer(tokenizer_path)
     print(f"✓ Tokenizer chargé: {tokenizer.__class__.__name__}")
 
     print(f"\n2. Chargement du modèle ONNX depuis {model_path}")
-    session = ort.InferenceSession(
-        model_path,
-        providers=['CPUExecutionProvider']
-    )
+    session = get_session(model_path)
     print("✓ Modèle ONNX chargé")
 
+    # Paires (premise, hypothesis) à tester
+    test_cases = [
+        # Test 1: Premise en allemand, Hypothesis en anglais
+        ("Test 1: Multilingue (DE → EN)",
+         "Angela Merkel ist eine Politikerin in Deutschland und Vorsitzende der CDU",
+         "Emmanuel Macron is the President of France"),
+        # Test 2: Entailment (implication vraie)
+        ("Test 2: Entailment - Implication vraie",
+         "Angela Merkel ist eine Politikerin in Deutschland und Vorsitzende der CDU",
+         "Angela Merkel is a politician"),
+        # Test 3: Contradiction
+        ("Test 3: Contradiction - Contradiction évidente",
+         "Le soleil brille et il fait beau",
+         "Il pleut et il fait sombre"),
+        # Test 4: Neutral
+        ("Test 4: Neutral - Pas de relation claire",
+         "J'aime manger des pommes",
+         "La tour Eiffel est à Paris"),
+    ]
+
     # Fonction helper pour faire l'inférence
-    def predict_nli(premise, hypothesis):
-        """Prédit la relation NLI entre premise et hypothesis"""
-        # Tokeniser
+    def predict_nli(premises, hypotheses):
+        """Prédit la relation NLI de chaque paire premise/hypothesis en un seul batch"""
+        # Tokeniser toutes les paires d'un coup
         inputs = tokenizer(
-            premise,
-            hypothesis,
+            premises,
+            hypotheses,
             truncation=True,
-            max_length=128,
-            padding='max_length',
+            max_length=MAX_LENGTH,
+            padding='longest',
             return_tensors='np'
         )
 
-        # Préparer les inputs pour ONNX Runtime
-        ort_inputs = {
-            'input_ids': inputs['input_ids'].astype(np.int64),
-            'attention_mask': inputs['attention_mask'].astype(np.int64)
-        }
-
-        # Inférence
-        outputs = session.run(None, ort_inputs)
-        logits = outputs[0][0]
+        # Inférence: une seule passe, logits de forme (N, 3)
+        logits = run_bound(session, inputs['input_ids'], inputs['attention_mask'])
 
-        # Appliquer softmax pour obtenir les probabilités
-        exp_logits = np.exp(logits - np.max(logits))
-        probs = exp_logits / exp_logits.sum()
+        # Appliquer softmax pour obtenir les probabilités (en %), laissées en tableau (N, 3)
+        probs = softmax(logits, out=logits)
+        probs *= 100
 
-        # Labels: entailment (0), neutral (1), contradiction (2)
-        label_names = ["entailment", "neutral", "contradiction"]
-        prediction_dict = {name: round(float(prob) * 100, 1) for prob, name in zip(probs, label_names)}
-
-        return prediction_dict
-
-    # Test 1: Premise en allemand, Hypothesis en anglais
-    print("\n" + "=" * 60)
-    print("Test 1: Multilingue (DE → EN)")
-    print("=" * 60)
-
-    premise = "Angela Merkel ist eine Politikerin in Deutschland und Vorsitzende der CDU"
-    hypothesis = "Emmanuel Macron is the President of France"
-
-    print(f"\nPremise:    {premise}")
-    print(f"Hypothesis: {hypothesis}")
-
-    prediction_dict = predict_nli(premise, hypothesis)
-
-    print("\nRésultats:")
-    for label, score in prediction_dict.items():
-        bar_length = int(score / 2.5)  # Scale to 40 chars max
-        bar = "█" * bar_length + "░" * (40 - bar_length)
-        print(f"  {label:15} {score:5.1f}%  {bar}")
-
-    # Test 2: Entailment (implication vraie)
-    print("\n" + "=" * 60)
-    print("Test 2: Entailment - Implication vraie")
-    print("=" * 60)
+        return probs
 
-    premise = "Angela Merkel ist eine Politikerin in Deutschland und Vorsitzende der CDU"
-    hypothesis = "Angela Merkel is a politician"
-
-    print(f"\nPremise:    {premise}")
-    print(f"Hypothesis: {hypothesis}")
-
-    prediction_dict = predict_nli(premise, hypothesis)
-
-    print("\nRésultats:")
-    for label, score in prediction_dict.items():
-        bar_length = int(score / 2.5)
-        bar = "█" * bar_length + "░" * (40 - bar_length)
-        print(f"  {label:15} {score:5.1f}%  {bar}")
-
-    # Test 3: Contradiction
-    print("\n" + "=" * 60)
-    print("Test 3: Contradiction - Contradiction évidente")
-    print("=" * 60)
-
-    premise = "Le soleil brille et il fait beau"
-    hypothesis = "Il pleut et il fait sombre"
-
-    print(f"\nPremise:    {premise}")
-    print(f"Hypothesis: {hypothesis}")
-
-    prediction_dict = predict_nli(premise, hypothesis)
-
-    print("\nRésultats:")
-    for label, score in prediction_dict.items():
-        bar_length = int(score / 2.5)
-        bar = "█" * bar_length + "░" * (40 - bar_length)
-        print(f"  {label:15} {score:5.1f}%  {bar}")
-
-    # Test 4: Neutral
-    print("\n" + "=" * 60)
-    print("Test 4: Neutral - Pas de relation claire")
-    print("=" * 60)
+    predictions = predict_nli(
+        [premise for _, premise, _ in test_cases],
+        [hypothesis for _, _, hypothesis in test_cases]
+    )
 
-    premise = "J'aime manger des pommes"
-    hypothesis = "La tour Eiffel est à Paris"
+    # Labels: entailment (0), neutral (1), contradiction (2)
+    label_names = ["entailment", "neutral", "contradiction"]
 
-    print(f"\nPremise:    {premise}")
-    print(f"Hypothesis: {hypothesis}")
+    for (title, premise, hypothesis), scores in zip(test_cases, predictions.tolist()):
+        print("\n" + "=" * 60)
+        print(title)
+        print("=" * 60)
 
-    prediction_dict = predict_nli(premise, hypothesis)
+        print(f"\nPremise:    {premise}")
+        print(f"Hypothesis: {hypothesis}")
 
-    print("\nRésultats:")
-    for label, score in prediction_dict.items():
-        bar_length = int(score / 2.5)
-        bar = "█" * bar_length + "░" * (40 - bar_length)
-        print(f"  {label:15} {score:5.1f}%  {bar}")
+        print("\nRésultats:")
+        for label, score in zip(label_names, scores):
+            bar_length = int(score / 2.5)  # Scale to 40 chars max
+            print(f"  {label:15} {score:5.1f}%  {bar(bar_length)}")
 
     print("\n" + "=" * 60)
     print("✓ Tests NLI terminés avec succès!")